@@ -1,20 +1,45 @@
 import os
+import re
+import ssl
+import atexit
+import sys
 import logging
+import queue
+import orjson
+from logging.handlers import QueueHandler, QueueListener
 from flask import Flask, jsonify
+from flask.json.provider import JSONProvider
 from slack_bolt import App
 from slack_bolt.adapter.socket_mode import SocketModeHandler
-from supabase_client import SupabaseClient
-from apscheduler.schedulers.background import BackgroundScheduler
-from apscheduler.triggers.cron import CronTrigger
-from datetime import datetime, date
+from slack_sdk.http_retry.builtin_handlers import RateLimitErrorRetryHandler
+from supabase_client import get_supabase_client
+from cachetools import TTLCache
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, date, timedelta
 import threading
+import time
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Configure logging; records are queued and written to stderr by a
+# background listener so handler threads never block on the stream
+_LOG_QUEUE = queue.SimpleQueue()
+logging.basicConfig(level=logging.INFO, handlers=[QueueHandler(_LOG_QUEUE)])
+_LOG_LISTENER = QueueListener(_LOG_QUEUE, logging.StreamHandler())
+_LOG_LISTENER.start()
+atexit.register(_LOG_LISTENER.stop)
 logger = logging.getLogger(__name__)
 
+class ORJSONProvider(JSONProvider):
+    """Flask JSON provider backed by orjson"""
+    
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
 # Initialize Flask app
 flask_app = Flask(__name__)
+flask_app.json = ORJSONProvider(flask_app)
 
 # Initialize Slack app with Socket Mode
 slack_app = App(
@@ -22,28 +47,181 @@ slack_app = App(
     signing_secret=os.environ.get("SLACK_SIGNING_SECRET")
 )
 
+# The Slack SDK opens a connection per call, so share one SSL context instead of
+# reloading the CA bundle every time. Per-request listener clients inherit it.
+slack_app.client.ssl = ssl.create_default_context()
+
+# Wait out Slack rate limits (HTTP 429 + Retry-After) instead of dropping the call
+slack_app.client.retry_handlers.append(RateLimitErrorRetryHandler(max_retry_count=3))
+
 # Initialize clients
-supabase_client = SupabaseClient()
+supabase_client = get_supabase_client()
+atexit.register(supabase_client.close)
+
+# Daily announcement time and the timer armed for its next run
+DAILY_ANNOUNCEMENT_HOUR = 9
+DAILY_ANNOUNCEMENT_MINUTE = 0
+_daily_timer = None
+_daily_next_run = None
+
+# Worker pool for Supabase and Slack calls made after a listener has acked
+_EXECUTOR = ThreadPoolExecutor(max_workers=16, thread_name_prefix="slack-worker")
+
+# Socket Mode handler, connected by initialize_app
+socket_handler = None
+
+# Number of Socket Mode events dispatched to listeners at once
+SOCKET_MODE_CONCURRENCY = int(os.environ.get("SOCKET_MODE_CONCURRENCY", "16"))
+
+# Admin user ID, resolved and interned once at startup
+ADMIN_USER_ID = sys.intern(os.environ.get("ADMIN_USER_ID", ""))
+if not ADMIN_USER_ID:
+    logger.warning("ADMIN_USER_ID is not set; leave requests cannot be routed for approval")
+
+# Recently handled approve/reject clicks, so repeated clicks are ignored
+_PROCESSED_ACTIONS = TTLCache(maxsize=4096, ttl=300)
+_PROCESSED_ACTIONS_LOCK = threading.Lock()
+
+# Recently sent approval notifications, keyed by (user_id, request id, approved)
+_SENT_NOTIFICATIONS = TTLCache(maxsize=1024, ttl=60)
+_SENT_NOTIFICATIONS_LOCK = threading.Lock()
+
+# Last /health database probe, reused for a few seconds between probes
+_DB_PROBE_TTL = 10.0
+_LAST_DB_PROBE = {"ts": 0.0, "status": "unknown"}
+_DB_PROBE_LOCK = threading.Lock()
 
-# Initialize scheduler
-scheduler = BackgroundScheduler()
+# /health timestamp, formatted at most once per second
+_HEALTH_TIMESTAMP = {"ts": 0.0, "iso": ""}
+
+# Most names listed in a single daily announcement message
+_ANNOUNCEMENT_CHUNK_SIZE = 50
+
+# Leave type options shared by the leave request and admin modals
+_LEAVE_TYPE_OPTIONS = [
+    {"text": {"type": "plain_text", "text": label}, "value": value}
+    for label, value in (
+        ("Vacation", "vacation"),
+        ("Sick Leave", "sick"),
+        ("Personal", "personal"),
+        ("Other", "other")
+    )
+]
+
+# Leave request modal, shared by every /request-leave invocation. views_open
+# only reads the view dicts when serializing, so they are passed without copying.
+_LEAVE_MODAL_VIEW = {
+    "type": "modal",
+    "callback_id": "leave_request_modal",
+    "title": {"type": "plain_text", "text": "Request Leave"},
+    "submit": {"type": "plain_text", "text": "Submit"},
+    "close": {"type": "plain_text", "text": "Cancel"},
+    "blocks": [
+        {
+            "type": "section",
+            "block_id": "leave_type_section",
+            "text": {"type": "mrkdwn", "text": "Select leave type:"},
+            "accessory": {
+                "type": "static_select",
+                "action_id": "leave_type_select",
+                "placeholder": {"type": "plain_text", "text": "Select type"},
+                "options": _LEAVE_TYPE_OPTIONS
+            }
+        },
+        {
+            "type": "input",
+            "block_id": "start_date",
+            "element": {"type": "datepicker", "action_id": "start_date_picker"},
+            "label": {"type": "plain_text", "text": "Start Date"}
+        },
+        {
+            "type": "input",
+            "block_id": "end_date",
+            "element": {"type": "datepicker", "action_id": "end_date_picker"},
+            "label": {"type": "plain_text", "text": "End Date"}
+        },
+        {
+            "type": "input",
+            "block_id": "reason",
+            "element": {
+                "type": "plain_text_input",
+                "action_id": "reason_input",
+                "multiline": True,
+                "placeholder": {"type": "plain_text", "text": "Reason for leave"}
+            },
+            "label": {"type": "plain_text", "text": "Reason"}
+        }
+    ]
+}
+
+# Admin balance update modal, shared by every /admin-update-balance invocation
+_ADMIN_UPDATE_MODAL_VIEW = {
+    "type": "modal",
+    "callback_id": "admin_update_modal",
+    "title": {"type": "plain_text", "text": "Update Leave Balance"},
+    "submit": {"type": "plain_text", "text": "Update"},
+    "close": {"type": "plain_text", "text": "Cancel"},
+    "blocks": [
+        {
+            "type": "input",
+            "block_id": "user_input",
+            "element": {
+                "type": "users_select",
+                "action_id": "user_select",
+                "placeholder": {"type": "plain_text", "text": "Select user"}
+            },
+            "label": {"type": "plain_text", "text": "User"}
+        },
+        {
+            "type": "section",
+            "block_id": "leave_type_section",
+            "text": {"type": "mrkdwn", "text": "Select leave type:"},
+            "accessory": {
+                "type": "static_select",
+                "action_id": "leave_type_select",
+                "placeholder": {"type": "plain_text", "text": "Select type"},
+                "options": _LEAVE_TYPE_OPTIONS
+            }
+        },
+        {
+            "type": "input",
+            "block_id": "days_input",
+            "element": {
+                "type": "plain_text_input",
+                "action_id": "days_input",
+                "placeholder": {"type": "plain_text", "text": "Enter number of days (use - to subtract)"}
+            },
+            "label": {"type": "plain_text", "text": "Days to add/subtract"}
+        }
+    ]
+}
+
+# Largest balance change, in days, accepted from the admin modal
+MAX_BALANCE_ADJUSTMENT_DAYS = 365
+
+# Static parts of the admin approval request message
+_APPROVAL_HEADER_BLOCK = {
+    "type": "header",
+    "text": {
+        "type": "plain_text",
+        "text": "🚀 New Leave Request"
+    }
+}
+_APPROVE_BUTTON_TEXT = {"type": "plain_text", "text": "✅ Approve"}
+_REJECT_BUTTON_TEXT = {"type": "plain_text", "text": "❌ Reject"}
 
 class SlackUtils:
-    def __init__(self, supabase_client):
+    def __init__(self, supabase_client, client):
         self.supabase = supabase_client
-        self.admin_user_id = os.getenv('ADMIN_USER_ID')
+        self.client = client
+        self.admin_user_id = ADMIN_USER_ID
     
     def send_approval_request(self, leave_request):
         """Send DM to admin for approval"""
         try:
+            request_id = str(leave_request['id'])
             blocks = [
-                {
-                    "type": "header",
-                    "text": {
-                        "type": "plain_text",
-                        "text": "🚀 New Leave Request"
-                    }
-                },
+                _APPROVAL_HEADER_BLOCK,
                 {
                     "type": "section",
                     "fields": [
@@ -70,29 +248,23 @@ class SlackUtils:
                     "elements": [
                         {
                             "type": "button",
-                            "text": {
-                                "type": "plain_text",
-                                "text": "✅ Approve"
-                            },
+                            "text": _APPROVE_BUTTON_TEXT,
                             "style": "primary",
                             "action_id": "approve_leave",
-                            "value": str(leave_request['id'])
+                            "value": request_id
                         },
                         {
                             "type": "button",
-                            "text": {
-                                "type": "plain_text",
-                                "text": "❌ Reject"
-                            },
+                            "text": _REJECT_BUTTON_TEXT,
                             "style": "danger",
                             "action_id": "reject_leave",
-                            "value": str(leave_request['id'])
+                            "value": request_id
                         }
                     ]
                 }
             ]
             
-            slack_app.client.chat_postMessage(
+            self.client.chat_postMessage(
                 channel=self.admin_user_id,
                 blocks=blocks,
                 text=f"New leave request from {leave_request['user_name']}"
@@ -102,106 +274,80 @@ class SlackUtils:
     
     def send_approval_notification(self, user_id, leave_request, approved=True):
         """Send notification to user about approval status"""
+        if not user_id or not leave_request:
+            return
+        
+        # Drop duplicate notifications from retried or interleaved clicks
+        key = (user_id, leave_request.get('id'), approved)
+        with _SENT_NOTIFICATIONS_LOCK:
+            if key in _SENT_NOTIFICATIONS:
+                return
+            _SENT_NOTIFICATIONS[key] = True
+        
         try:
             status = "approved" if approved else "rejected"
             emoji = "✅" if approved else "❌"
             
             message = f"{emoji} Your leave request from {leave_request['start_date']} to {leave_request['end_date']} has been {status}."
             
-            slack_app.client.chat_postMessage(
+            self.client.chat_postMessage(
                 channel=user_id,
                 text=message
             )
         except Exception as e:
             logger.error(f"Error sending approval notification: {e}")
     
-    def post_leave_announcement(self, channel, user_name, leave_date):
-        """Post leave announcement to channel"""
+    def post_leave_announcement(self, channel, user_names, leave_date):
+        """Post everyone on leave to channel as one bulleted message per chunk of names"""
         try:
-            message = f"🏖️ {user_name} is on leave today ({leave_date})"
-            
-            slack_app.client.chat_postMessage(
-                channel=channel,
-                text=message
-            )
+            for start in range(0, len(user_names), _ANNOUNCEMENT_CHUNK_SIZE):
+                names = user_names[start:start + _ANNOUNCEMENT_CHUNK_SIZE]
+                message = f"🏖️ On leave today ({leave_date}):\n" + "\n".join(f"• {name}" for name in names)
+                
+                self.client.chat_postMessage(
+                    channel=channel,
+                    text=message
+                )
         except Exception as e:
             logger.error(f"Error posting leave announcement: {e}")
     
     def create_leave_modal(self, trigger_id):
         """Create modal for leave request"""
         try:
-            modal = {
-                "type": "modal",
-                "callback_id": "leave_request_modal",
-                "title": {"type": "plain_text", "text": "Request Leave"},
-                "submit": {"type": "plain_text", "text": "Submit"},
-                "close": {"type": "plain_text", "text": "Cancel"},
-                "blocks": [
-                    {
-                        "type": "section",
-                        "block_id": "leave_type_section",
-                        "text": {"type": "mrkdwn", "text": "Select leave type:"},
-                        "accessory": {
-                            "type": "static_select",
-                            "action_id": "leave_type_select",
-                            "placeholder": {"type": "plain_text", "text": "Select type"},
-                            "options": [
-                                {"text": {"type": "plain_text", "text": "Vacation"}, "value": "vacation"},
-                                {"text": {"type": "plain_text", "text": "Sick Leave"}, "value": "sick"},
-                                {"text": {"type": "plain_text", "text": "Personal"}, "value": "personal"},
-                                {"text": {"type": "plain_text", "text": "Other"}, "value": "other"}
-                            ]
-                        }
-                    },
-                    {
-                        "type": "input",
-                        "block_id": "start_date",
-                        "element": {"type": "datepicker", "action_id": "start_date_picker"},
-                        "label": {"type": "plain_text", "text": "Start Date"}
-                    },
-                    {
-                        "type": "input",
-                        "block_id": "end_date",
-                        "element": {"type": "datepicker", "action_id": "end_date_picker"},
-                        "label": {"type": "plain_text", "text": "End Date"}
-                    },
-                    {
-                        "type": "input",
-                        "block_id": "reason",
-                        "element": {
-                            "type": "plain_text_input",
-                            "action_id": "reason_input",
-                            "multiline": True,
-                            "placeholder": {"type": "plain_text", "text": "Reason for leave"}
-                        },
-                        "label": {"type": "plain_text", "text": "Reason"}
-                    }
-                ]
-            }
-            
-            slack_app.client.views_open(trigger_id=trigger_id, view=modal)
+            self.client.views_open(trigger_id=trigger_id, view=_LEAVE_MODAL_VIEW)
         except Exception as e:
             logger.error(f"Error creating leave modal: {e}")
 
 # Initialize Slack utils
-slack_utils = SlackUtils(supabase_client)
+slack_utils = SlackUtils(supabase_client, slack_app.client)
 
 @flask_app.route("/health", methods=["GET"])
 def health_check():
     """Health check endpoint"""
     try:
-        # Test database connection
-        db_status = "healthy"
-        try:
-            supabase_client.client.table('leave_requests').select('id').limit(1).execute()
-        except Exception as e:
-            db_status = f"unhealthy: {str(e)}"
+        # Test database connection, reusing a recent result; concurrent
+        # probes wait for a single refresh instead of each querying
+        with _DB_PROBE_LOCK:
+            if time.monotonic() - _LAST_DB_PROBE["ts"] >= _DB_PROBE_TTL:
+                status = "healthy"
+                try:
+                    supabase_client.ping()
+                except Exception as e:
+                    status = f"unhealthy: {str(e)}"
+                _LAST_DB_PROBE.update(ts=time.monotonic(), status=status)
+            db_status = _LAST_DB_PROBE["status"]
+        
+        wall_now = time.time()
+        if wall_now - _HEALTH_TIMESTAMP["ts"] >= 1.0:
+            _HEALTH_TIMESTAMP.update(ts=wall_now, iso=datetime.fromtimestamp(wall_now).isoformat())
         
         health_info = {
             "status": "healthy",
-            "timestamp": datetime.now().isoformat(),
+            "timestamp": _HEALTH_TIMESTAMP["iso"],
             "database": db_status,
-            "scheduler": "running" if scheduler.running else "stopped",
+            "scheduler": "running" if _daily_timer is not None and _daily_timer.is_alive() else "stopped",
+            "next_announcement": _daily_next_run.isoformat() if _daily_next_run else None,
+            "socket_mode": "connected" if socket_handler is not None and socket_handler.client.is_connected() else "disconnected",
             "version": "1.0.0"
         }
         
@@ -213,7 +359,7 @@ def health_check():
 def readiness_check():
     """Readiness check for Kubernetes"""
     try:
-        supabase_client.client.table('leave_requests').select('id').limit(1).execute()
+        supabase_client.ping()
         return jsonify({"status": "ready"}), 200
     except Exception as e:
         return jsonify({"status": "not ready", "error": str(e)}), 503
@@ -227,7 +373,7 @@ def handle_leave_request(ack, body, client, logger):
         user_id = body["user_id"]
         
         # Check if user is admin
-        if user_id == os.getenv('ADMIN_USER_ID'):
+        if user_id == ADMIN_USER_ID:
             client.chat_postEphemeral(
                 channel=body["channel_id"],
                 user=user_id,
@@ -241,19 +387,25 @@ def handle_leave_request(ack, body, client, logger):
         logger.error(f"Error handling leave request: {e}")
 
 @slack_app.command("/leave-balance")
-def handle_leave_balance(ack, body, client, logger):
+def handle_leave_balance(ack, body, client):
     """Handle leave balance check command"""
     ack()
+    _EXECUTOR.submit(process_leave_balance, body, client)
+
+def process_leave_balance(body, client):
+    """Look up the user's leave balance and reply ephemerally"""
     try:
         user_id = body["user_id"]
         balance = supabase_client.get_user_leave_balance(user_id)
         
         if balance:
-            message = f"📊 Your Leave Balance:\n"
-            message += f"• Vacation: {balance.get('vacation', 0)} days\n"
-            message += f"• Sick Leave: {balance.get('sick', 0)} days\n"
-            message += f"• Personal: {balance.get('personal', 0)} days\n"
-            message += f"• Other: {balance.get('other', 0)} days"
+            message = (
+                "📊 Your Leave Balance:\n"
+                f"• Vacation: {balance.get('vacation', 0)} days\n"
+                f"• Sick Leave: {balance.get('sick', 0)} days\n"
+                f"• Personal: {balance.get('personal', 0)} days\n"
+                f"• Other: {balance.get('other', 0)} days"
+            )
         else:
             message = "No leave balance found. Please contact admin."
         
@@ -273,7 +425,7 @@ def handle_admin_update_balance(ack, body, client, logger):
         user_id = body["user_id"]
         
         # Check if user is admin
-        if user_id != os.getenv('ADMIN_USER_ID'):
+        if user_id != ADMIN_USER_ID:
             client.chat_postEphemeral(
                 channel=body["channel_id"],
                 user=user_id,
@@ -283,53 +435,7 @@ def handle_admin_update_balance(ack, body, client, logger):
         
         # Open admin modal for balance updates
         try:
-            modal = {
-                "type": "modal",
-                "callback_id": "admin_update_modal",
-                "title": {"type": "plain_text", "text": "Update Leave Balance"},
-                "submit": {"type": "plain_text", "text": "Update"},
-                "close": {"type": "plain_text", "text": "Cancel"},
-                "blocks": [
-                    {
-                        "type": "input",
-                        "block_id": "user_input",
-                        "element": {
-                            "type": "users_select",
-                            "action_id": "user_select",
-                            "placeholder": {"type": "plain_text", "text": "Select user"}
-                        },
-                        "label": {"type": "plain_text", "text": "User"}
-                    },
-                    {
-                        "type": "section",
-                        "block_id": "leave_type_section",
-                        "text": {"type": "mrkdwn", "text": "Select leave type:"},
-                        "accessory": {
-                            "type": "static_select",
-                            "action_id": "leave_type_select",
-                            "placeholder": {"type": "plain_text", "text": "Select type"},
-                            "options": [
-                                {"text": {"type": "plain_text", "text": "Vacation"}, "value": "vacation"},
-                                {"text": {"type": "plain_text", "text": "Sick Leave"}, "value": "sick"},
-                                {"text": {"type": "plain_text", "text": "Personal"}, "value": "personal"},
-                                {"text": {"type": "plain_text", "text": "Other"}, "value": "other"}
-                            ]
-                        }
-                    },
-                    {
-                        "type": "input",
-                        "block_id": "days_input",
-                        "element": {
-                            "type": "plain_text_input",
-                            "action_id": "days_input",
-                            "placeholder": {"type": "plain_text", "text": "Enter number of days (use - to subtract)"}
-                        },
-                        "label": {"type": "plain_text", "text": "Days to add/subtract"}
-                    }
-                ]
-            }
-            
-            client.views_open(trigger_id=body["trigger_id"], view=modal)
+            client.views_open(trigger_id=body["trigger_id"], view=_ADMIN_UPDATE_MODAL_VIEW)
         except Exception as e:
             logger.error(f"Error opening admin modal: {e}")
             client.chat_postEphemeral(
@@ -341,16 +447,20 @@ def handle_admin_update_balance(ack, body, client, logger):
         logger.error(f"Error handling admin update: {e}")
 
 @slack_app.command("/leave-history")
-def handle_leave_history(ack, body, client, logger):
+def handle_leave_history(ack, body, client):
     """Handle leave history command"""
     ack()
+    _EXECUTOR.submit(process_leave_history, body, client)
+
+def process_leave_history(body, client):
+    """Look up the user's recent leave requests and reply ephemerally"""
     try:
         user_id = body["user_id"]
-        leave_requests = supabase_client.get_user_leave_requests(user_id)
+        leave_requests = supabase_client.get_user_leave_requests(user_id, limit=10)
         
         if leave_requests:
             message = "📋 Your Leave History:\n"
-            for req in leave_requests[:10]:  # Show last 10 requests
+            for req in leave_requests:
                 status_emoji = "✅" if req['status'] == 'approved' else "⏳" if req['status'] == 'pending' else "❌"
                 message += f"{status_emoji} {req['start_date']} to {req['end_date']} - {req['leave_type']} ({req['status']})\n"
         else:
@@ -366,9 +476,13 @@ def handle_leave_history(ack, body, client, logger):
 
 # Modal submission handlers
 @slack_app.view("leave_request_modal")
-def handle_modal_submission(ack, body, client, view, logger):
+def handle_modal_submission(ack, body, client, view):
     """Handle leave request modal submission"""
     ack()
+    _EXECUTOR.submit(process_leave_submission, body, client, view)
+
+def process_leave_submission(body, client, view):
+    """Create the submitted leave request and notify the admin"""
     try:
         user_id = body["user"]["id"]
         user_name = body["user"]["name"]
@@ -391,8 +505,8 @@ def handle_modal_submission(ack, body, client, view, logger):
         )
         
         if leave_request:
-            # Send approval request to admin
-            slack_utils.send_approval_request(leave_request)
+            # Send approval request to admin alongside the user confirmation
+            _EXECUTOR.submit(slack_utils.send_approval_request, leave_request)
             
             # Confirm to user
             client.chat_postMessage(
@@ -409,9 +523,27 @@ def handle_modal_submission(ack, body, client, view, logger):
         logger.error(f"Error handling modal submission: {e}")
 
 @slack_app.view("admin_update_modal")
-def handle_admin_modal_submission(ack, body, client, view, logger):
+def handle_admin_modal_submission(ack, body, client, view):
     """Handle admin update modal submission"""
+    # Reject bad input inline on the modal rather than after it closes
+    try:
+        days = int(view["state"]["values"]["days_input"]["days_input"]["value"])
+    except (TypeError, ValueError):
+        ack(response_action="errors", errors={"days_input": "Enter a whole number of days."})
+        return
+    if days == 0:
+        ack(response_action="errors", errors={"days_input": "Enter a non-zero number of days."})
+        return
+    if abs(days) > MAX_BALANCE_ADJUSTMENT_DAYS:
+        ack(response_action="errors", errors={
+            "days_input": f"Enter at most {MAX_BALANCE_ADJUSTMENT_DAYS} days either way."
+        })
+        return
     ack()
+    _EXECUTOR.submit(process_admin_balance_update, body, client, view, days)
+
+def process_admin_balance_update(body, client, view, days):
+    """Apply the admin's balance change and confirm it"""
     try:
         admin_user_id = body["user"]["id"]
         
@@ -419,7 +551,6 @@ def handle_admin_modal_submission(ack, body, client, view, logger):
         values = view["state"]["values"]
         target_user_id = values["user_input"]["user_select"]["selected_user"]
         leave_type = values["leave_type_section"]["leave_type_select"]["selected_option"]["value"]
-        days = int(values["days_input"]["days_input"]["value"])
         
         # Update user balance
         result = supabase_client.update_user_leave_balance(target_user_id, leave_type, days)
@@ -443,10 +574,28 @@ def handle_admin_modal_submission(ack, body, client, view, logger):
         logger.error(f"Error handling admin modal submission: {e}")
 
 # Button action handlers
-@slack_app.action("approve_leave")
-def handle_approve_leave(ack, body, client, logger):
-    """Handle leave approval"""
+@slack_app.action(re.compile(r"^(approve|reject)_leave$"))
+def handle_leave_decision(ack, body, client):
+    """Handle leave approval or rejection"""
     ack()
+    action_id = body["actions"][0]["action_id"]
+    
+    # Ignore repeated clicks on this process while the first is being handled;
+    # the status update itself only applies to a pending request
+    key = f"{body['container']['message_ts']}:{action_id}"
+    with _PROCESSED_ACTIONS_LOCK:
+        if key in _PROCESSED_ACTIONS:
+            return
+        _PROCESSED_ACTIONS[key] = True
+    
+    approved = action_id.startswith("approve")
+    _EXECUTOR.submit(process_leave_decision, body, client, approved, key)
+
+def process_leave_decision(body, client, approved, key):
+    """Approve or reject the leave request and notify the user"""
+    status = "approved" if approved else "rejected"
+    emoji = "✅" if approved else "❌"
+    leave_request = None
     try:
         request_id = body["actions"][0]["value"]
         admin_user_id = body["user"]["id"]
@@ -454,88 +603,127 @@ def handle_approve_leave(ack, body, client, logger):
         # Update leave request status
         leave_request = supabase_client.update_leave_request_status(
             request_id=request_id,
-            status="approved",
+            status=status,
             approved_by=admin_user_id
         )
         
+        current = None
+        if not leave_request:
+            # No pending row matched: a retried update may already have applied this
+            # decision, or the request was decided elsewhere. Check which.
+            current = supabase_client.get_leave_request(request_id)
+            if current and current["status"] == status and current["approved_by"] == admin_user_id:
+                leave_request = current
+        
         if leave_request:
-            # Notify user
-            slack_utils.send_approval_notification(
+            supabase_client.invalidate_balance(leave_request["user_id"])
+            
+            # Notify user while the admin message is updated
+            _EXECUTOR.submit(
+                slack_utils.send_approval_notification,
                 user_id=leave_request["user_id"],
                 leave_request=leave_request,
-                approved=True
+                approved=approved
             )
             
             # Update response message
             client.chat_update(
                 channel=body["container"]["channel_id"],
                 ts=body["container"]["message_ts"],
-                text=f"✅ Leave request approved by <@{admin_user_id}>"
+                text=f"{emoji} Leave request {status} by <@{admin_user_id}>"
             )
-            
-    except Exception as e:
-        logger.error(f"Error approving leave: {e}")
-
-@slack_app.action("reject_leave")
-def handle_reject_leave(ack, body, client, logger):
-    """Handle leave rejection"""
-    ack()
-    try:
-        request_id = body["actions"][0]["value"]
-        admin_user_id = body["user"]["id"]
-        
-        # Update leave request status
-        leave_request = supabase_client.update_leave_request_status(
-            request_id=request_id,
-            status="rejected",
-            approved_by=admin_user_id
-        )
-        
-        if leave_request:
-            # Notify user
-            slack_utils.send_approval_notification(
-                user_id=leave_request["user_id"],
-                leave_request=leave_request,
-                approved=False
-            )
-            
-            # Update response message
+        elif current and current["status"] != "pending":
+            # Already decided; show that on the message instead of live buttons
+            decided_by = f" by <@{current['approved_by']}>" if current["approved_by"] else ""
+            decided_emoji = "✅" if current["status"] == "approved" else "❌"
             client.chat_update(
                 channel=body["container"]["channel_id"],
                 ts=body["container"]["message_ts"],
-                text=f"❌ Leave request rejected by <@{admin_user_id}>"
+                text=f"{decided_emoji} Leave request already {current['status']}{decided_by}"
+            )
+        else:
+            client.chat_postMessage(
+                channel=admin_user_id,
+                text="❌ Could not update this leave request. Please try again."
             )
             
     except Exception as e:
-        logger.error(f"Error rejecting leave: {e}")
+        logger.error(f"Error updating leave request to {status}: {e}")
+    finally:
+        if not leave_request:
+            # Let the admin click again after a failure
+            with _PROCESSED_ACTIONS_LOCK:
+                _PROCESSED_ACTIONS.pop(key, None)
 
 def post_daily_leave_announcements():
     """Post daily leave announcements"""
     try:
+        # One date for both the query and the message, even across midnight
         today = date.today().isoformat()
-        leaves_today = supabase_client.get_todays_leaves()
+        summary = supabase_client.get_todays_leave_summary(today)
         
-        if leaves_today:
+        if summary and summary["leave_count"]:
             # Post to a general channel
             channel = "#general"
-            for leave in leaves_today:
-                slack_utils.post_leave_announcement(
-                    channel=channel,
-                    user_name=leave["user_name"],
-                    leave_date=today
-                )
-            logger.info(f"Posted {len(leaves_today)} leave announcements for {today}")
+            slack_utils.post_leave_announcement(
+                channel=channel,
+                user_names=summary["user_names"],
+                leave_date=today
+            )
+            logger.info(f"Announced {summary['leave_count']} leaves for {today}")
     except Exception as e:
         logger.error(f"Error posting daily leave announcements: {e}")
 
+def next_daily_run(after):
+    """Return the first daily announcement time strictly after `after`"""
+    next_run = after.replace(
+        hour=DAILY_ANNOUNCEMENT_HOUR,
+        minute=DAILY_ANNOUNCEMENT_MINUTE,
+        second=0,
+        microsecond=0
+    )
+    if next_run <= after:
+        next_run += timedelta(days=1)
+    return next_run
+
+def schedule_daily_announcements(after=None):
+    """Arm a timer for the next daily leave announcement"""
+    global _daily_timer, _daily_next_run
+    now = datetime.now()
+    next_run = next_daily_run(after or now)
+    _daily_timer = threading.Timer(
+        (next_run - now).total_seconds(),
+        run_daily_announcements,
+        args=(next_run,)
+    )
+    _daily_timer.daemon = True
+    _daily_timer.start()
+    _daily_next_run = next_run
+    logger.info(f"Next daily leave announcement at {next_run.isoformat()}")
+
+def run_daily_announcements(scheduled_for):
+    """Post today's announcements, then re-arm the timer for the next day"""
+    try:
+        post_daily_leave_announcements()
+    finally:
+        schedule_daily_announcements(after=scheduled_for)
+
 def start_socket_mode():
-    """Start Socket Mode handler"""
+    """Connect the Socket Mode handler; its client runs on its own threads"""
+    global socket_handler
     try:
-        socket_handler = SocketModeHandler(slack_app, os.environ["SLACK_APP_TOKEN"])
-        logger.info("Starting Socket Mode handler...")
-        socket_handler.start()
+        socket_handler = SocketModeHandler(
+            slack_app,
+            os.environ["SLACK_APP_TOKEN"],
+            concurrency=SOCKET_MODE_CONCURRENCY
+        )
+        logger.info("Connecting Socket Mode handler...")
+        socket_handler.connect()
+        logger.info("Socket Mode connected")
     except Exception as e:
+        # A worker without Slack connectivity is useless; fail its boot so it is restarted
         logger.error(f"Failed to start Socket Mode: {e}")
+        raise
 
 def initialize_app():
     """Initialize application"""
@@ -547,24 +735,8 @@ def initialize_app():
     else:
         logger.error("Failed to initialize database")
     
-    # Start scheduler for daily announcements (9 AM daily)
-    scheduler.add_job(
-        post_daily_leave_announcements,
-        trigger=CronTrigger(hour=9, minute=0),
-        id="daily_leave_announcements"
-    )
-    
-    if not scheduler.running:
-        scheduler.start()
-        logger.info("Scheduler started")
-    
-    # Start Socket Mode in a separate thread
-    socket_thread = threading.Thread(target=start_socket_mode, daemon=True)
-    socket_thread.start()
-    logger.info("Socket Mode thread started")
-
-if __name__ == "__main__":
-    initialize_app()
+    # Schedule daily announcements (9 AM daily)
+    schedule_daily_announcements()
     
-    # Start Flask app
-    flask_app.run(host="0.0.0.0", port=5000, debug=False)
\ No newline at end of file
+    # Connect Socket Mode without blocking the caller
+    start_socket_mode()
@@ -25,11 +25,15 @@ CREATE TABLE IF NOT EXISTS user_leave_balances (
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
 
+-- Drop indexes duplicated by idx_leave_requests_user_id_created_at and the UNIQUE user_id constraint
+DROP INDEX IF EXISTS idx_leave_requests_user_id;
+DROP INDEX IF EXISTS idx_user_leave_balances_user_id;
+
 -- Create indexes
-CREATE INDEX IF NOT EXISTS idx_leave_requests_user_id ON leave_requests(user_id);
 CREATE INDEX IF NOT EXISTS idx_leave_requests_status ON leave_requests(status);
 CREATE INDEX IF NOT EXISTS idx_leave_requests_start_date ON leave_requests(start_date);
-CREATE INDEX IF NOT EXISTS idx_user_leave_balances_user_id ON user_leave_balances(user_id);
+CREATE INDEX IF NOT EXISTS idx_leave_requests_start_date_approved ON leave_requests(start_date, status) WHERE status = 'approved';
+CREATE INDEX IF NOT EXISTS idx_leave_requests_user_id_created_at ON leave_requests(user_id, created_at DESC);
 
 -- Function to update updated_at
 CREATE OR REPLACE FUNCTION update_updated_at_column()
@@ -40,13 +44,71 @@ BEGIN
 END;
 $$ language 'plpgsql';
 
--- Triggers
+-- Triggers, dropped first so the script can be re-run on an existing database
+DROP TRIGGER IF EXISTS update_leave_requests_updated_at ON leave_requests;
 CREATE TRIGGER update_leave_requests_updated_at
     BEFORE UPDATE ON leave_requests
     FOR EACH ROW
     EXECUTE FUNCTION update_updated_at_column();
 
+DROP TRIGGER IF EXISTS update_user_leave_balances_updated_at ON user_leave_balances;
 CREATE TRIGGER update_user_leave_balances_updated_at
     BEFORE UPDATE ON user_leave_balances
     FOR EACH ROW
-    EXECUTE FUNCTION update_updated_at_column();
\ No newline at end of file
+    EXECUTE FUNCTION update_updated_at_column();
+
+-- Approved leaves starting on a given day, aggregated into one row
+CREATE OR REPLACE FUNCTION todays_leave_summary(p_date DATE DEFAULT CURRENT_DATE)
+RETURNS TABLE (leave_date DATE, user_names TEXT[], leave_count INTEGER) AS $$
+    SELECT p_date, array_agg(user_name ORDER BY user_name), COUNT(*)::INTEGER
+    FROM leave_requests
+    WHERE start_date = p_date AND status = 'approved';
+$$ LANGUAGE sql STABLE;
+
+-- Atomically add p_days to one leave type of a user's balance, creating the
+-- row (other types at their defaults, never below zero) if it does not exist
+CREATE OR REPLACE FUNCTION adjust_leave_balance(p_user_id TEXT, p_leave_type TEXT, p_days INTEGER)
+RETURNS SETOF user_leave_balances AS $$
+BEGIN
+    IF p_leave_type NOT IN ('vacation', 'sick', 'personal', 'other') THEN
+        RAISE EXCEPTION 'Invalid leave type: %', p_leave_type;
+    END IF;
+
+    RETURN QUERY EXECUTE format(
+        'INSERT INTO user_leave_balances AS b (user_id, %1$I) VALUES ($2, GREATEST(0, $1))
+         ON CONFLICT (user_id) DO UPDATE SET %1$I = b.%1$I + $1
+         RETURNING *',
+        p_leave_type
+    ) USING p_days, p_user_id;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Constant-time connectivity check for health probes
+CREATE OR REPLACE FUNCTION ping()
+RETURNS INTEGER AS $$
+    SELECT 1;
+$$ LANGUAGE sql STABLE;
+
+-- Which of the given tables exist in the public schema, in one query
+CREATE OR REPLACE FUNCTION existing_tables(p_names TEXT[])
+RETURNS TABLE (table_name TEXT) AS $$
+    SELECT t.table_name::TEXT
+    FROM information_schema.tables t
+    WHERE t.table_schema = 'public' AND t.table_name = ANY(p_names);
+$$ LANGUAGE sql STABLE;
+
+-- Per-user remaining balance across all leave types and approved days taken
+CREATE OR REPLACE FUNCTION leave_balance_summary()
+RETURNS TABLE (user_id TEXT, total_remaining INTEGER, total_used INTEGER) AS $$
+    SELECT b.user_id,
+           b.vacation + b.sick + b.personal + b.other,
+           COALESCE(u.days, 0)::INTEGER
+    FROM user_leave_balances b
+    LEFT JOIN (
+        SELECT r.user_id, SUM(r.end_date - r.start_date + 1) AS days
+        FROM leave_requests r
+        WHERE r.status = 'approved'
+        GROUP BY r.user_id
+    ) u ON u.user_id = b.user_id
+    ORDER BY b.user_id;
+$$ LANGUAGE sql STABLE;
\ No newline at end of file
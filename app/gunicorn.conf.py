@@ -0,0 +1,15 @@
+# Gunicorn configuration for the Leave Tracker Flask app
+bind = "0.0.0.0:5000"
+worker_class = "gthread"
+
+# The scheduler and Socket Mode connection run inside the worker process,
+# so a second worker would post every daily announcement twice.
+workers = 1
+threads = 8
+
+# If Socket Mode cannot connect, initialize_app raises; the worker then fails
+# to boot and gunicorn exits, so the container is restarted.
+def post_fork(server, worker):
+    """Start the scheduler and Socket Mode connection once per worker"""
+    from app import initialize_app
+    initialize_app()
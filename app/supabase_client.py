@@ -1,56 +1,238 @@
 import os
+import functools
+import httpx
 from supabase import create_client, Client
-from datetime import datetime, date
+from datetime import date
 import logging
+import random
+import threading
 import time
+from cachetools import TTLCache
+from postgrest.exceptions import APIError
+from postgrest.types import ReturnMethod
+from postgrest.utils import SyncClient
 
 logger = logging.getLogger(__name__)
 
+# Network failures worth retrying; the request may not have reached PostgREST
+TRANSIENT_HTTP_ERRORS = (
+    httpx.ConnectError,
+    httpx.ConnectTimeout,
+    httpx.RemoteProtocolError,
+    httpx.ReadTimeout,
+    httpx.WriteTimeout,
+    httpx.PoolTimeout
+)
+
+# Failures raised before the request was sent, so even non-idempotent writes
+# can be retried without risk of applying twice
+UNSENT_HTTP_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+# Bounds on every PostgREST call, so a hung socket or a full pool fails fast
+# into _retry instead of holding a worker thread
+POSTGREST_TIMEOUT = httpx.Timeout(connect=2.0, read=5.0, write=5.0, pool=1.0)
+
+# Longest single backoff sleep between retries, in seconds
+MAX_RETRY_DELAY = 10.0
+
+# Postgres error classes that clear up on retry: connection, rollback,
+# insufficient resources and operator intervention (e.g. statement timeout)
+TRANSIENT_SQLSTATE_CLASSES = ('08', '40', '53', '57')
+
+# PostgREST's own connection errors: database unreachable, pool timeout and
+# the like, sent as 503/504
+TRANSIENT_POSTGREST_CODES = ('PGRST000', 'PGRST001', 'PGRST002', 'PGRST003')
+
+def is_transient_error(error):
+    """Return True if a failed Supabase call is worth retrying"""
+    if isinstance(error, TRANSIENT_HTTP_ERRORS):
+        return True
+    if isinstance(error, APIError):
+        # Non-JSON error pages (e.g. a 503 from the gateway) carry the HTTP status as an int
+        if isinstance(error.code, int):
+            return 500 <= error.code < 600
+        code = str(error.code or '')
+        return code in TRANSIENT_POSTGREST_CODES or code[:2] in TRANSIENT_SQLSTATE_CLASSES
+    return False
+
+# Errors for an RPC whose function does not exist: PostgREST's schema cache
+# miss and Postgres' undefined_function
+MISSING_FUNCTION_CODES = ('PGRST202', '42883')
+
+# Tables created by database/init_schema.sql that the app cannot run without
+REQUIRED_TABLES = frozenset({'leave_requests', 'user_leave_balances'})
+
+# Leave type columns of user_leave_balances, as cached per user
+BALANCE_COLUMNS = ('vacation', 'sick', 'personal', 'other')
+BALANCE_SELECT = ','.join(BALANCE_COLUMNS)
+
+# Most rows sent in one bulk insert request
+BULK_INSERT_CHUNK_SIZE = 500
+
+# Default projections for the leave_requests getters; callers may pass their own
+LEAVE_REQUEST_COLUMNS = 'id,user_id,user_name,start_date,end_date,reason,leave_type,status,approved_by'
+LEAVE_HISTORY_COLUMNS = 'start_date,end_date,leave_type,status'
+
+# Columns returned by update_leave_request_status for the approval flow
+LEAVE_DECISION_COLUMNS = 'id,user_id,user_name,start_date,end_date,leave_type,reason'
+
 class SupabaseClient:
     def __init__(self):
         self.url = os.getenv('SUPABASE_URL')
         self.key = os.getenv('SUPABASE_KEY')
         self.client: Client = create_client(self.url, self.key)
+        self._configure_http_session()
         self.max_retries = 3
+        # Short-lived per-user balance cache; balances change rarely
+        self._balance_cache = TTLCache(maxsize=1024, ttl=60)
+        # Bumped on every balance write or invalidation, so a read that raced one
+        # does not cache the old balance
+        self._balance_generation = 0
+        self._balance_lock = threading.RLock()
+        # Leave request lists, keyed by query and arguments; cleared on every leave request
+        # write made by this process. The generation stops a read that raced a write from
+        # caching the old rows.
+        self._leave_reads_cache = TTLCache(maxsize=128, ttl=30)
+        self._leave_reads_generation = 0
+        self._leave_reads_lock = threading.Lock()
+    
+    def _configure_http_session(self):
+        """Give PostgREST a bounded keep-alive HTTP/2 connection pool with explicit timeouts"""
+        # supabase-py drops its PostgREST client (and with it this session) on auth
+        # events (SIGNED_IN, TOKEN_REFRESHED, SIGNED_OUT). The app never signs in,
+        # but anything that does must call this again.
+        postgrest = self.client.postgrest
+        default_session = postgrest.session
+        # postgrest's own client type, so SyncPostgrestClient.aclose()/__exit__ still work
+        postgrest.session = SyncClient(
+            base_url=default_session.base_url,
+            headers=default_session.headers,
+            # Concurrent calls share multiplexed connections instead of each needing one
+            http2=True,
+            timeout=POSTGREST_TIMEOUT,
+            # Caps connections when the server falls back to HTTP/1.1; over HTTP/2 concurrent
+            # calls share a connection, so this is not a bound on concurrency. Postgres
+            # connections behind PostgREST are pooled by Supabase, so SUPABASE_URL stays the
+            # project's API URL.
+            limits=httpx.Limits(max_connections=25, max_keepalive_connections=25, keepalive_expiry=30)
+        )
+        default_session.close()
+    
+    def _retry(self, operation, *args, base_delay=0.1, idempotent=True):
+        """Run operation(*args), retrying transient errors with jittered exponential backoff"""
+        for attempt in range(self.max_retries):
+            try:
+                return operation(*args)
+            except Exception as e:
+                # A write that may have reached the server is never replayed
+                retryable = is_transient_error(e) if idempotent else isinstance(e, UNSENT_HTTP_ERRORS)
+                if attempt == self.max_retries - 1 or not retryable:
+                    raise
+                time.sleep(random.uniform(0, min(MAX_RETRY_DELAY, base_delay * 2 ** attempt)))
+    
+    def close(self):
+        """Close pooled HTTP connections"""
+        self.client.postgrest.session.close()
+    
+    def _select(self, table, columns, filters, order, desc, limit):
+        """Run one SELECT on table and return its rows"""
+        query = self.client.table(table).select(columns)
+        for column, value in filters.items():
+            query = query.eq(column, value)
+        if order:
+            query = query.order(order, desc=desc)
+        if limit:
+            query = query.limit(limit)
+        return query.execute().data
+    
+    def _select_one(self, table, columns, filters):
+        """Return the single row of table matching filters, or None; retried, as reads are idempotent"""
+        # Not maybe_single(): postgrest 0.13 replaces every error it sees with "Missing response"
+        rows = self._retry(self._select, table, columns, filters, None, False, 1)
+        return rows[0] if rows else None
+    
+    def _select_many(self, table, columns, filters, order=None, desc=False, limit=None):
+        """Return the rows of table matching filters; retried, as reads are idempotent"""
+        return self._retry(self._select, table, columns, filters, order, desc, limit)
+    
+    def _rpc(self, function, params):
+        """Call a database function and return its rows"""
+        return self.client.rpc(function, params).execute().data
+    
+    def _insert(self, table, data):
+        """Insert a row, or a list of rows, and return the inserted rows"""
+        return self.client.table(table).insert(data).execute().data
+    
+    def _update(self, table, data, filters, columns):
+        """Update the rows of table matching filters and return their columns in the same request"""
+        query = self.client.table(table).update(data, returning=ReturnMethod.representation)
+        for column, value in filters.items():
+            query = query.eq(column, value)
+        query.params = query.params.add('select', columns)
+        return query.execute().data
+    
+    def ping(self):
+        """Run a constant-time SELECT 1 on the database; raises on failure"""
+        self._retry(self._rpc, 'ping', {})
     
     def init_db(self):
         """Initialize database - tables are created via SQL"""
         try:
-            # Test connection
-            self.client.table('leave_requests').select('id').limit(1).execute()
+            # Test connection and check every table exists in one round-trip
+            rows = self._retry(self._rpc, 'existing_tables', {'p_names': sorted(REQUIRED_TABLES)})
+            missing = REQUIRED_TABLES.difference(row['table_name'] for row in rows or ())
+            if missing:
+                logger.error(f"Missing tables {', '.join(sorted(missing))}; apply database/init_schema.sql")
+                return False
             logger.info("Database connection successful")
             return True
-        except Exception as e:
+        except APIError as e:
+            if e.code in MISSING_FUNCTION_CODES:
+                logger.error("Schema functions are missing; apply database/init_schema.sql")
+            else:
+                logger.error(f"Database connection failed: {e}")
+            return False
+        except httpx.HTTPError as e:
             logger.error(f"Database connection failed: {e}")
             return False
     
     def create_leave_request(self, user_id, user_name, start_date, end_date, reason, leave_type):
         """Create a new leave request"""
-        for attempt in range(self.max_retries):
-            try:
-                data = {
-                    'user_id': user_id,
-                    'user_name': user_name,
-                    'start_date': start_date,
-                    'end_date': end_date,
-                    'reason': reason,
-                    'leave_type': leave_type,
-                    'status': 'pending',
-                    'created_at': datetime.now().isoformat()
-                }
-                response = self.client.table('leave_requests').insert(data).execute()
-                return response.data[0] if response.data else None
-            except Exception as e:
-                if attempt == self.max_retries - 1:
-                    logger.error(f"Error creating leave request: {e}")
-                    return None
-                time.sleep(1)
+        try:
+            data = {
+                'user_id': user_id,
+                'user_name': user_name,
+                'start_date': start_date,
+                'end_date': end_date,
+                'reason': reason,
+                'leave_type': leave_type,
+                'status': 'pending'
+            }
+            rows = self._retry(self._insert, 'leave_requests', data, idempotent=False)
+            self.invalidate_leave_reads()
+            return rows[0] if rows else None
+        except Exception as e:
+            logger.error(f"Error creating leave request: {e}")
+            return None
     
-    def get_leave_request(self, request_id):
+    def create_leave_requests_bulk(self, rows):
+        """Insert many leave requests, one request per chunk of rows; returns the rows inserted"""
+        inserted = []
+        try:
+            for start in range(0, len(rows), BULK_INSERT_CHUNK_SIZE):
+                chunk = rows[start:start + BULK_INSERT_CHUNK_SIZE]
+                inserted.extend(self._retry(self._insert, 'leave_requests', chunk, idempotent=False))
+        except Exception as e:
+            logger.error(f"Error bulk creating leave requests after {len(inserted)} rows: {e}")
+        finally:
+            if inserted:
+                self.invalidate_leave_reads()
+        return inserted
+    
+    def get_leave_request(self, request_id, columns=LEAVE_REQUEST_COLUMNS):
         """Get a specific leave request"""
         try:
-            response = self.client.table('leave_requests').select('*').eq('id', request_id).execute()
-            return response.data[0] if response.data else None
+            return self._select_one('leave_requests', columns, {'id': request_id})
         except Exception as e:
             logger.error(f"Error getting leave request: {e}")
             return None
@@ -58,66 +240,130 @@ class SupabaseClient:
     def update_leave_request_status(self, request_id, status, approved_by=None):
         """Update leave request status"""
         try:
-            data = {
-                'status': status,
-                'updated_at': datetime.now().isoformat()
-            }
+            # created_at/updated_at are set by column defaults and the updated_at trigger
+            data = {'status': status}
             if approved_by:
                 data['approved_by'] = approved_by
             
-            response = self.client.table('leave_requests').update(data).eq('id', request_id).execute()
-            return response.data[0] if response.data else None
+            # Only a pending request can be decided, so a repeated decision updates no row.
+            # The updated row comes back in the same request; only return what callers read
+            rows = self._retry(
+                self._update, 'leave_requests', data, {'id': request_id, 'status': 'pending'}, LEAVE_DECISION_COLUMNS
+            )
+            self.invalidate_leave_reads()
+            return rows[0] if rows else None
         except Exception as e:
             logger.error(f"Error updating leave request: {e}")
             return None
     
     def get_user_leave_balance(self, user_id):
-        """Get user's leave balance"""
+        """Get user's leave balance, served from the balance cache when fresh"""
+        with self._balance_lock:
+            balance = self._balance_cache.get(user_id)
+            generation = self._balance_generation
+        if balance is None:
+            balance = self._fetch_user_leave_balance(user_id)
+            if balance is not None:
+                with self._balance_lock:
+                    if generation == self._balance_generation:
+                        self._balance_cache[user_id] = balance
+        return balance
+    
+    def _fetch_user_leave_balance(self, user_id):
+        """Read user's leave balance from the database, bypassing the cache"""
         try:
-            response = self.client.table('user_leave_balances').select('*').eq('user_id', user_id).execute()
-            return response.data[0] if response.data else None
+            return self._select_one('user_leave_balances', BALANCE_SELECT, {'user_id': user_id})
         except Exception as e:
             logger.error(f"Error getting leave balance: {e}")
             return None
     
+    def invalidate_balance(self, user_id):
+        """Drop a user's cached leave balance"""
+        with self._balance_lock:
+            self._balance_generation += 1
+            self._balance_cache.pop(user_id, None)
+    
+    def _cache_balance(self, user_id, row):
+        """Store the balance columns of a freshly written row in the balance cache"""
+        balance = {column: row[column] for column in BALANCE_COLUMNS}
+        with self._balance_lock:
+            self._balance_generation += 1
+            self._balance_cache[user_id] = balance
+    
     def update_user_leave_balance(self, user_id, leave_type, days):
         """Update user's leave balance"""
+        if days == 0:
+            # Nothing to change; skip the write
+            return self.get_user_leave_balance(user_id)
         try:
-            current = self.get_user_leave_balance(user_id)
-            if current:
-                new_balance = current.get(leave_type, 0) + days
-                response = self.client.table('user_leave_balances').update({
-                    leave_type: new_balance,
-                    'updated_at': datetime.now().isoformat()
-                }).eq('user_id', user_id).execute()
-            else:
-                data = {
-                    'user_id': user_id,
-                    leave_type: max(0, days),
-                    'created_at': datetime.now().isoformat()
-                }
-                response = self.client.table('user_leave_balances').insert(data).execute()
+            # Add days, or create the balance row, in one atomic upsert on the server
+            response = self.client.rpc('adjust_leave_balance', {
+                'p_user_id': user_id,
+                'p_leave_type': leave_type,
+                'p_days': days
+            }).execute()
             
-            return response.data[0] if response.data else None
+            if not response.data:
+                self.invalidate_balance(user_id)
+                return None
+            # The upsert returns the written row; keep it so the next read skips the database
+            row = response.data[0]
+            self._cache_balance(user_id, row)
+            return row
         except Exception as e:
             logger.error(f"Error updating leave balance: {e}")
+            self.invalidate_balance(user_id)
             return None
     
-    def get_todays_leaves(self):
-        """Get all leaves for today"""
+    def _cached_leave_read(self, key, fetch, *args, **kwargs):
+        """Return fetch(*args, **kwargs), reusing a fresh result cached under key"""
+        with self._leave_reads_lock:
+            if key in self._leave_reads_cache:
+                return self._leave_reads_cache[key]
+            generation = self._leave_reads_generation
+        data = fetch(*args, **kwargs)
+        with self._leave_reads_lock:
+            if generation == self._leave_reads_generation:
+                self._leave_reads_cache[key] = data
+        return data
+    
+    def invalidate_leave_reads(self):
+        """Drop all cached leave request lists"""
+        with self._leave_reads_lock:
+            self._leave_reads_generation += 1
+            self._leave_reads_cache.clear()
+    
+    def get_leave_balance_summary(self):
+        """Get every user's total remaining and used leave, aggregated on the server"""
         try:
-            today = date.today().isoformat()
-            response = self.client.table('leave_requests').select('*').eq('start_date', today).eq('status', 'approved').execute()
-            return response.data
+            return self._retry(self._rpc, 'leave_balance_summary', {})
         except Exception as e:
-            logger.error(f"Error getting today's leaves: {e}")
+            logger.error(f"Error getting leave balance summary: {e}")
             return []
     
-    def get_user_leave_requests(self, user_id):
-        """Get all leave requests for a user"""
+    def get_todays_leave_summary(self, today=None):
+        """Get the approved leaves starting today (or on the given ISO date) aggregated into a single row"""
         try:
-            response = self.client.table('leave_requests').select('*').eq('user_id', user_id).order('created_at', desc=True).execute()
-            return response.data
+            today = today or date.today().isoformat()
+            rows = self._retry(self._rpc, 'todays_leave_summary', {'p_date': today})
+            return rows[0] if rows else None
+        except Exception as e:
+            logger.error(f"Error getting today's leave summary: {e}")
+            return None
+    
+    def get_user_leave_requests(self, user_id, limit=10, columns=LEAVE_HISTORY_COLUMNS):
+        """Get a user's most recent leave requests, newest first"""
+        try:
+            return self._cached_leave_read(
+                ('user_leave_requests', user_id, limit, columns),
+                self._select_many, 'leave_requests', columns, {'user_id': user_id},
+                order='created_at', desc=True, limit=limit
+            )
         except Exception as e:
             logger.error(f"Error getting user leave requests: {e}")
-            return []
\ No newline at end of file
+            return []
+
+@functools.lru_cache(maxsize=1)
+def get_supabase_client():
+    """Return the process-wide SupabaseClient so its HTTP connections are reused"""
+    return SupabaseClient()
@@ -0,0 +1,4 @@
+from app import flask_app
+
+# WSGI entry point used by gunicorn
+application = flask_app